@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Process, cpu_count
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import cv2
+
+from Evolver import Evolver, SURVIVAL_SIZE
+from RunController import RunController
+
+DEFAULT_JOB = {'generations': 1000,
+               'display_step': 100,
+               'time_budget': None,
+               'max_evaluations': None,
+               'plateau_window': None,
+               'plateau_tolerance': 0.001,
+               'max_restarts': 0,
+               'memory_cap_mb': None,
+               'survival_size': SURVIVAL_SIZE,
+               'checkpoint_step': 100}
+
+# settings a job may have that have no default
+JOB_ONLY_KEYS = ('name', 'target_pic')
+
+# seconds between checks on running job processes
+POLL_INTERVAL = 0.5
+
+
+def load_manifest(manifest_path):
+    """
+    Read a batch manifest. A manifest is a JSON file of the form:
+
+        {"defaults": {"generations": 5000, "memory_cap_mb": 512},
+         "jobs": [{"target_pic": "cat.png"},
+                  {"name": "dog", "target_pic": "dog.png",
+                   "generations": 200, "time_budget": 600}]}
+
+    "defaults" is optional and overrides DEFAULT_JOB for every job. Every
+    job needs a target_pic; name defaults to the target's base filename.
+    Relative target paths are taken relative to the manifest. A
+    ValueError is raised for unknown settings and for steps or a
+    plateau_window below 1.
+    :param manifest_path: Filename of the manifest
+    :return: List of job dicts with every setting filled in
+    """
+    with open(manifest_path) as f_manifest:
+        manifest = json.load(f_manifest)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    check_job_keys(manifest.get('defaults', {}), 'defaults')
+    defaults = DEFAULT_JOB.copy()
+    defaults.update(manifest.get('defaults', {}))
+    jobs = []
+    names = set()
+    for job_spec in manifest['jobs']:
+        if 'target_pic' not in job_spec:
+            raise ValueError("job is missing a target_pic")
+        check_job_keys(job_spec, job_spec['target_pic'])
+        job = defaults.copy()
+        job.update(job_spec)
+        job['target_pic'] = os.path.join(manifest_dir, job['target_pic'])
+        if 'name' not in job:
+            job['name'] = os.path.splitext(
+                os.path.basename(job['target_pic']))[0]
+        if job['name'] in names:
+            raise ValueError("duplicate job name {}".format(job['name']))
+        names.add(job['name'])
+        for step_key in ('display_step', 'checkpoint_step'):
+            if job[step_key] < 1:
+                raise ValueError("{} of job {} must be at least 1".format(
+                    step_key, job['name']))
+        if job['plateau_window'] is not None and job['plateau_window'] < 1:
+            raise ValueError("plateau_window of job {} must be at least "
+                             "1".format(job['name']))
+        jobs.append(job)
+    return jobs
+
+
+def check_job_keys(job_spec, where):
+    """
+    Reject settings that aren't in DEFAULT_JOB so a typo doesn't silently
+    fall back to the default value.
+    :param job_spec: Job settings from the manifest
+    :param where: Description of job_spec for the error message
+    """
+    unknown = set(job_spec) - set(DEFAULT_JOB) - set(JOB_ONLY_KEYS)
+    if unknown:
+        raise ValueError("unknown settings in {}: {}".format(
+            where, ', '.join(sorted(unknown))))
+
+
+def cap_memory(memory_cap_mb):
+    """
+    Limit the address space of the current process so a runaway job
+    fails with a MemoryError instead of taking the machine down.
+    Raises a RuntimeError if the limit can't be set on this platform.
+    :param memory_cap_mb: Limit in megabytes, or None for no limit
+    """
+    if memory_cap_mb is None:
+        return
+    if resource is None:
+        raise RuntimeError("memory_cap_mb needs the resource module, "
+                           "which this platform doesn't have")
+    cap_bytes = int(memory_cap_mb) * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (cap_bytes, cap_bytes))
+
+
+def run_job(job, out_dir):
+    """
+    Run one evolution to completion inside a job process. Everything
+    the job produces goes in out_dir/<name>/: the surviving images, the
+    best Picture found as best_<pic_id>.png, log.txt with everything
+    printed, fit_log.json with the best fitness of each generation,
+    checkpoint.pkl and result.json. If a checkpoint
+    is already there the job resumes from it, with the budgets, restarts
+    and plateau history it had, so a finished job just rewrites its result.
+    :param job: Job dict from load_manifest()
+    :param out_dir: Folder holding the per-job folders
+    :return: The result dict also written to result.json
+    """
+    job_dir = os.path.join(out_dir, job['name'])
+    if not os.path.isdir(job_dir):
+        os.makedirs(job_dir)
+    checkpoint_path = os.path.join(job_dir, 'checkpoint.pkl')
+    fit_log_path = os.path.join(job_dir, 'fit_log.json')
+    result = {'name': job['name'],
+              'target_pic': job['target_pic'],
+              'status': 'running'}
+    start_time = time.time()
+    stdout = sys.stdout
+    f_log = open(os.path.join(job_dir, 'log.txt'), 'a')
+    sys.stdout = f_log
+    try:
+        cap_memory(job['memory_cap_mb'])
+        resume = os.path.exists(checkpoint_path)
+        evolver = Evolver(target_pic=job['target_pic'],
+                          survival_size=job['survival_size'],
+                          output_dir=job_dir,
+                          checkpoint_path=checkpoint_path if resume else None)
+        controller = RunController(
+            evolver, max_generations=job['generations'],
+            time_budget=job['time_budget'],
+            max_evaluations=job['max_evaluations'],
+            plateau_window=job['plateau_window'],
+            plateau_tolerance=job['plateau_tolerance'],
+            max_restarts=job['max_restarts'])
+        if evolver.run_state is not None:
+            controller.set_state(evolver.run_state)
+        if resume:
+            print("Resumed at pop {}".format(evolver.iteration))
+        # setting up counts against the time budget too
+        controller.elapsed += time.time() - start_time
+
+        def save_progress():
+            evolver.save_checkpoint(checkpoint_path, controller.get_state())
+            with open(fit_log_path, 'w') as f_fit:
+                json.dump([int(fit) for fit in controller.fit_vals], f_fit)
+
+        def on_generation(fit_result):
+            print("Pop {pid}: {fit}".format(pid=evolver.iteration - 1,
+                                             fit=fit_result))
+            if evolver.iteration % job['checkpoint_step'] == 0:
+                save_progress()
+
+        reason = controller.run(job['display_step'], on_generation)
+        save_progress()
+        result['status'] = 'done' if reason == 'generations' else reason
+        result['generations'] = evolver.iteration
+        result['restarts'] = controller.restarts
+        if controller.best is not None:
+            result['best_pic_id'] = int(controller.best[0])
+            result['best_fitness'] = int(controller.best[1])
+            result['best_img'] = 'best_{}.png'.format(controller.best[0])
+            cv2.imwrite(os.path.join(job_dir, result['best_img']),
+                        evolver.best_pic.render_picture())
+    except Exception as err:
+        result['status'] = 'failed'
+        result['error'] = '{}: {}'.format(type(err).__name__, err)
+        print(result['error'])
+    finally:
+        sys.stdout = stdout
+        f_log.close()
+    result['elapsed'] = time.time() - start_time
+    with open(os.path.join(job_dir, 'result.json'), 'w') as f_result:
+        json.dump(result, f_result, indent=2)
+    return result
+
+
+def collect_result(job, out_dir, exitcode):
+    """
+    Read the result.json a finished job process wrote. A process that was
+    killed (e.g. by the OOM killer) or crashed in native code never writes
+    one, so a failed result is written in its place.
+    :param job: Job dict from load_manifest()
+    :param out_dir: Folder holding the per-job folders
+    :param exitcode: Exit code of the job process
+    :return: The job's result dict
+    """
+    result_path = os.path.join(out_dir, job['name'], 'result.json')
+    if exitcode == 0 and os.path.exists(result_path):
+        with open(result_path) as f_result:
+            return json.load(f_result)
+    result = {'name': job['name'],
+              'target_pic': job['target_pic'],
+              'status': 'failed',
+              'error': 'job process exited with code {}'.format(exitcode)}
+    with open(result_path, 'w') as f_result:
+        json.dump(result, f_result, indent=2)
+    return result
+
+
+def run_batch(jobs, out_dir, workers=None):
+    """
+    Run every job in its own process, at most workers at a time, so a
+    job's memory cap and any memory it leaks die with it. Processes are
+    polled rather than waited on through a pool, so a job process that
+    dies without reporting back is recorded as failed instead of hanging
+    the batch. A summary of all results is written to out_dir/summary.json.
+    :param jobs: List of job dicts from load_manifest()
+    :param out_dir: Folder to put the per-job folders in
+    :param workers: Number of jobs to run at once. Defaults to the CPU
+                    count.
+    :return: List of result dicts, in the order the jobs finished
+    """
+    if workers is None:
+        workers = cpu_count()
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    pending = list(jobs)
+    running = {}
+    results = []
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                job = pending.pop(0)
+                job_dir = os.path.join(out_dir, job['name'])
+                if not os.path.isdir(job_dir):
+                    os.makedirs(job_dir)
+                result_path = os.path.join(job_dir, 'result.json')
+                if os.path.exists(result_path):
+                    os.remove(result_path)
+                proc = Process(target=run_job, args=(job, out_dir))
+                proc.start()
+                running[proc] = job
+            time.sleep(POLL_INTERVAL)
+            for proc in list(running):
+                if proc.is_alive():
+                    continue
+                proc.join()
+                result = collect_result(running.pop(proc), out_dir,
+                                        proc.exitcode)
+                print("{name}: {status}".format(**result))
+                results.append(result)
+    finally:
+        for proc in running:
+            proc.terminate()
+            proc.join()
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f_summary:
+        json.dump(results, f_summary, indent=2)
+    return results
+
+
+def main():
+    """
+    Command line entry point: python BatchRunner.py manifest.json
+    """
+    parser = argparse.ArgumentParser(
+        description="Evolve pictures for every target in a manifest.")
+    parser.add_argument('manifest', help="JSON manifest of jobs")
+    parser.add_argument('-o', '--out-dir', default='batch_out',
+                        help="folder for per-job output")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="number of worker processes")
+    args = parser.parse_args()
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    results = run_batch(load_manifest(args.manifest), args.out_dir,
+                        args.workers)
+    failed = [result for result in results if result['status'] == 'failed']
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,51 +1,69 @@
+import copy
 import operator
+import os
+import pickle
 
 import cv2
 from VisualObjects import Picture
-from GUI import display_pic
 
 SURVIVAL_SIZE = 2
-CHILD_AMOUNT = SURVIVAL_SIZE**2
-POPULATION_SIZE = 2*CHILD_AMOUNT + SURVIVAL_SIZE #(10)
 
 class Evolver(object):
     """
-    Class to evolve the pictures. Creates POPULATION_SIZE members in each
-    population. Generates 2/5 from two parents, 2/5 from one parent, and
-    1/5 from the last generation.
+    Class to evolve the pictures. Each population has 2x^2 + x members,
+    where x = survival_size: x survivors from the last generation, x^2
+    generated from two parents and x^2 from one parent.
 
     Evaluates members in a population against a base picture using the
-    Mean Squared Error and Structural Similarity Indexing. The top 1/5
+    Mean Squared Error and Structural Similarity Indexing. The top x
     of the population "lives" on into the next population, and the
-    remaining 4/5 of the next population are developed from a parent or
-    parents in the top 1/5.
+    remaining 2x^2 of the next population are developed from a parent or
+    parents in the top x.
     """
 
-    def __init__(self, target_pic="target_pic.png"):
+    def __init__(self, target_pic="target_pic.png",
+                 survival_size=SURVIVAL_SIZE, output_dir=".",
+                 checkpoint_path=None):
         """
-        Create the initial population of pictures randomly.
+        Create the initial population of pictures randomly, or restore it
+        from a checkpoint.
         :param grid_size: Number of pixels on a side of the picture. It's
                           important that this number be evenly divisible
                           by 100, 50, 20, and 10. A multiple of 100 is
                           ideal.
         :param target_pic: Filename of the target picture. Defaults to
                            "target_pic.png" in the PicEvo folder.
+        :param survival_size: Number of Pictures surviving each iteration.
+                              The population holds 2x^2 + x Pictures.
+        :param output_dir: Folder the surviving Pictures are written to.
+        :param checkpoint_path: Checkpoint written by save_checkpoint() to
+                                restore instead of generating a random
+                                population.
         """
         self.population = {}
         self.target_pic = cv2.imread(target_pic)
+        assert self.target_pic is not None, "could not read target_pic"
         self.grid_size = len(self.target_pic)
-        for i in range(POPULATION_SIZE):
+        self.survival_size = survival_size
+        self.output_dir = output_dir
+        self.iteration = 0
+        self.best_pic = None
+        self.best_fitness = None
+        self.run_state = None
+        if checkpoint_path is not None:
+            self.load_checkpoint(checkpoint_path)
+            return
+        for i in range(self.pop_size):
             print(i)
             new_pic = Picture(grid_size=self.grid_size)
             self.population[new_pic.pic_id] = new_pic
-        self.iteration = 0
 
     @property
     def pop_size(self):
         """
         :return: Size of the population.
         """
-        return POPULATION_SIZE
+        return 2*self.survival_size**2 + self.survival_size
 
     def get_pic_at(self, pic_id):
         """
@@ -80,7 +98,8 @@ class Evolver(object):
         of the new Pictures will be generated by merging two parents, and
         1/2 will be generated from mutating one parent. See the docs of
         Picture.generate_merge_parents() and Picture.generate_mutate_parent().
-        Where x = SURVIVAL_SIZE
+        Where x = self.survival_size
+        A copy of the best Picture found so far is kept in self.best_pic.
         :return: Lowest fitness value
         """
         # get fitness values for every picture in the population
@@ -94,15 +113,22 @@ class Evolver(object):
         # select the top x for survival and create new population
         sorted_fit_vals = sorted(fitness_vals.items(),
                                  key=operator.itemgetter(1))
-        surviving_ids = [pair[0] for pair in sorted_fit_vals[:SURVIVAL_SIZE]]
+        surviving_ids = [pair[0] for pair in sorted_fit_vals[:self.survival_size]]
         surviving_pics = [(surv_id, self.population[surv_id])
                           for surv_id in surviving_ids]
         if self.iteration % iter_show_step == 0:
             for pic_id in surviving_ids:
-                img_name = 'img_{}.png'.format(pic_id)
+                img_name = os.path.join(self.output_dir,
+                                        'img_{}.png'.format(pic_id))
                 cv2.imwrite(img_name,
                             self.population[pic_id].render_picture()
                             )
+        # copy the best Picture before breeding, since children share
+        # and mutate their parents' RandRGBs
+        if self.best_fitness is None or \
+                sorted_fit_vals[0][1] < self.best_fitness:
+            self.best_pic = copy.deepcopy(self.population[surviving_ids[0]])
+            self.best_fitness = sorted_fit_vals[0][1]
         new_population = dict(surviving_pics)
         new_pop_holder = new_population.copy()
 
@@ -118,3 +144,58 @@ class Evolver(object):
 
         self.population = new_population
         return sorted_fit_vals[0]
+
+    def save_checkpoint(self, checkpoint_path, run_state=None):
+        """
+        Pickle the current population, iteration count and best Picture
+        so the evolution can be resumed later with load_checkpoint().
+        :param checkpoint_path: Filename to write the checkpoint to
+        :param run_state: Optional state of whatever drives the Evolver,
+                          e.g. RunController.get_state(). It is restored
+                          into self.run_state.
+        """
+        state = {'population': self.population,
+                 'iteration': self.iteration,
+                 'survival_size': self.survival_size,
+                 'best_pic': self.best_pic,
+                 'best_fitness': self.best_fitness,
+                 'run_state': run_state}
+        tmp_path = checkpoint_path + '.tmp'
+        with open(tmp_path, 'wb') as f_ckpt:
+            pickle.dump(state, f_ckpt, pickle.HIGHEST_PROTOCOL)
+        # os.rename only overwrites an existing file on POSIX
+        if os.name == 'nt' and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        os.rename(tmp_path, checkpoint_path)
+
+    def load_checkpoint(self, checkpoint_path):
+        """
+        Replace the population, iteration count and best Picture with the
+        ones stored by save_checkpoint(). Picture.NEXT_PIC_ID is advanced
+        past the restored pic_ids so new Pictures don't collide with them.
+        :param checkpoint_path: Filename of the checkpoint to read
+        """
+        with open(checkpoint_path, 'rb') as f_ckpt:
+            state = pickle.load(f_ckpt)
+        self.population = state['population']
+        self.iteration = state['iteration']
+        self.survival_size = state['survival_size']
+        self.best_pic = state['best_pic']
+        self.best_fitness = state['best_fitness']
+        self.run_state = state['run_state']
+        Picture.NEXT_PIC_ID = max(Picture.NEXT_PIC_ID,
+                                  max(self.population) + 1)
+
+    def restart_population(self, keep_pics):
+        """
+        Replace the population with copies of keep_pics plus freshly
+        generated Pictures. Used to escape a plateau without losing the
+        best Pictures found so far. keep_pics themselves are left untouched.
+        :param keep_pics: Pictures to keep
+        """
+        new_population = dict((pic.pic_id, copy.deepcopy(pic))
+                              for pic in keep_pics)
+        while len(new_population) < self.pop_size:
+            new_pic = Picture(grid_size=self.grid_size)
+            new_population[new_pic.pic_id] = new_pic
+        self.population = new_population
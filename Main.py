@@ -1,19 +1,44 @@
-import sys
+import argparse
 import json
 from Evolver import Evolver
+from RunController import RunController
 
 if __name__ == '__main__':
-    args = sys.argv
-    generations = int(args[1])
-    display_step =int(args[2])
+    parser = argparse.ArgumentParser(
+        description="Evolve a picture towards target_pic_sm.png.")
+    parser.add_argument('generations', type=int)
+    parser.add_argument('display_step', type=int)
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help="seconds to run for at most")
+    parser.add_argument('--max-evals', type=int, default=None,
+                        help="pictures to evaluate at most")
+    parser.add_argument('--plateau-window', type=int, default=None,
+                        help="generations without improvement that count "
+                             "as a plateau")
+    parser.add_argument('--plateau-tolerance', type=float, default=0.001,
+                        help="relative improvement below which the fitness "
+                             "has plateaued")
+    parser.add_argument('--restarts', type=int, default=0,
+                        help="restarts allowed on a plateau before stopping")
+    args = parser.parse_args()
+    if args.plateau_window is not None and args.plateau_window < 1:
+        parser.error("--plateau-window must be at least 1")
     testEvo = Evolver(target_pic="target_pic_sm.png")
     print("Pop 0: " + str(len(testEvo.population)))
-    fit_vals = []
-    for x in range(generations):
-        fit_result = testEvo.iterate_evo(display_step)
-        fit_vals.append(fit_result[1])
-        print("Pop {pid}: {fit}".format(pid=x, fit=fit_result))
-    with open('fit_log.txt','w') as f_log:
-        print(fit_vals)
+    controller = RunController(testEvo,
+                               max_generations=args.generations,
+                               time_budget=args.time_budget,
+                               max_evaluations=args.max_evals,
+                               plateau_window=args.plateau_window,
+                               plateau_tolerance=args.plateau_tolerance,
+                               max_restarts=args.restarts)
 
+    def print_result(fit_result):
+        print("Pop {pid}: {fit}".format(pid=testEvo.iteration - 1,
+                                         fit=fit_result))
 
+    reason = controller.run(args.display_step, print_result)
+    print("Stopped ({reason}) after {gens} generations, best: {best}".format(
+        reason=reason, gens=testEvo.iteration, best=controller.best))
+    with open('fit_log.txt','w') as f_log:
+        json.dump([int(fit) for fit in controller.fit_vals], f_log)
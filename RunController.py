@@ -0,0 +1,163 @@
+import time
+
+
+class RunController(object):
+    """
+    Drives an Evolver by calling iterate_evo() until a budget runs out or
+    the fitness stops improving. Budgets are a total generation count, a
+    wall-clock time in seconds and a number of Picture evaluations; any of
+    them can be None to leave it unlimited.
+
+    A plateau is reached when the best fitness found so far has improved
+    by less than plateau_tolerance (relative) over the last plateau_window
+    generations. On a plateau the controller restarts the population,
+    keeping a copy of the best Picture found so far, up to max_restarts
+    times, and then stops.
+    """
+
+    def __init__(self, evolver, max_generations=None, time_budget=None,
+                 max_evaluations=None, plateau_window=None,
+                 plateau_tolerance=0.001, max_restarts=0):
+        """
+        :param evolver: The Evolver to drive
+        :param max_generations: Stop once evolver.iteration reaches this
+        :param time_budget: Seconds run() may take, counting earlier
+                            runs restored with set_state()
+        :param max_evaluations: Number of Pictures that may be evaluated.
+                                Each generation evaluates pop_size of them.
+        :param plateau_window: Generations to look back when checking for
+                               a plateau. None disables plateau detection.
+        :param plateau_tolerance: Smallest relative improvement of the
+                                  best fitness over plateau_window
+                                  generations that isn't a plateau
+        :param max_restarts: Restarts allowed before a plateau stops the run
+        """
+        if plateau_window is not None and plateau_window < 1:
+            raise ValueError("plateau_window must be at least 1")
+        self.evolver = evolver
+        self.max_generations = max_generations
+        self.time_budget = time_budget
+        self.max_evaluations = max_evaluations
+        self.plateau_window = plateau_window
+        self.plateau_tolerance = plateau_tolerance
+        self.max_restarts = max_restarts
+        self.fit_vals = []
+        self.best_history = []
+        self.evaluations = 0
+        self.restarts = 0
+        self.window_start = 0
+        self.elapsed = 0
+        self.gen_time = 0
+
+    def get_state(self):
+        """
+        :return: Dict of the run's progress for set_state(), so a resumed
+                 run keeps its budgets and plateau history.
+        """
+        return {'fit_vals': self.fit_vals,
+                'best_history': self.best_history,
+                'evaluations': self.evaluations,
+                'restarts': self.restarts,
+                'window_start': self.window_start,
+                'elapsed': self.elapsed,
+                'gen_time': self.gen_time}
+
+    def set_state(self, state):
+        """
+        Restore the run's progress from get_state().
+        :param state: Dict returned by get_state()
+        """
+        self.fit_vals = state['fit_vals']
+        self.best_history = state['best_history']
+        self.evaluations = state['evaluations']
+        self.restarts = state['restarts']
+        self.window_start = state['window_start']
+        self.elapsed = state['elapsed']
+        self.gen_time = state['gen_time']
+
+    @property
+    def best(self):
+        """
+        :return: (pic_id, fitness) of the best Picture found so far, or
+                 None before the first generation. The Picture itself is
+                 kept in evolver.best_pic.
+        """
+        if self.evolver.best_pic is None:
+            return None
+        return self.evolver.best_pic.pic_id, self.evolver.best_fitness
+
+    def out_of_budget(self):
+        """
+        Check whether another generation fits in the budgets. A generation
+        that would overrun the time budget, judging by how long the last
+        one took, is not started.
+        :return: Name of the exhausted budget, or None
+        """
+        if self.max_generations is not None and \
+                self.evolver.iteration >= self.max_generations:
+            return 'generations'
+        if self.time_budget is not None and \
+                self.elapsed + self.gen_time > self.time_budget:
+            return 'time_budget'
+        if self.max_evaluations is not None and \
+                self.evaluations + self.evolver.pop_size > self.max_evaluations:
+            return 'evaluations'
+        return None
+
+    def on_plateau(self):
+        """
+        Compare the best fitness now with the best fitness plateau_window
+        generations ago. Generations before the last restart don't count.
+        :return: True if the run has plateaued
+        """
+        if self.plateau_window is None:
+            return False
+        if len(self.best_history) - self.window_start <= self.plateau_window:
+            return False
+        old_best = self.best_history[-self.plateau_window - 1]
+        if old_best == 0:
+            return True
+        improvement = float(old_best - self.best_history[-1]) / abs(old_best)
+        return improvement < self.plateau_tolerance
+
+    def run(self, iter_show_step, on_generation=None):
+        """
+        Iterate the evolver until a budget is exhausted or a plateau ends
+        the run.
+        :param iter_show_step: Passed through to Evolver.iterate_evo()
+        :param on_generation: Optional function called with the result of
+                              every iterate_evo()
+        :return: Why the run stopped: 'generations', 'time_budget',
+                 'evaluations' or 'plateau'
+        """
+        # a run that ended on a plateau stays ended when resumed
+        if self.on_plateau():
+            return 'plateau'
+        start_time = time.time() - self.elapsed
+        while True:
+            reason = self.out_of_budget()
+            if reason is not None:
+                return reason
+            gen_start = time.time()
+            fit_result = self.evolver.iterate_evo(iter_show_step)
+            self.gen_time = time.time() - gen_start
+            self.elapsed = time.time() - start_time
+            self.evaluations += self.evolver.pop_size
+            self.fit_vals.append(fit_result[1])
+            self.best_history.append(self.evolver.best_fitness)
+            # restart before on_generation so a checkpoint taken there
+            # never holds a plateau that still has restarts left
+            plateau = self.on_plateau()
+            restarted = plateau and self.restarts < self.max_restarts
+            if restarted:
+                self.restarts += 1
+                self.window_start = len(self.best_history)
+                self.evolver.restart_population([self.evolver.best_pic])
+            if on_generation is not None:
+                on_generation(fit_result)
+            if restarted:
+                # numbered like the "Pop N" lines of on_generation
+                print("Plateau at pop {}, restart {}".format(
+                    self.evolver.iteration - 1, self.restarts))
+            elif plateau:
+                return 'plateau'